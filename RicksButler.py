@@ -1,11 +1,17 @@
 #  -*- coding: UTF-8 -*-
 
 import sys
-import speech_recognition as sr
+import socket
+import threading
+import queue
 import time
 import logging
+import numpy as np
+import sounddevice as sd
+import webrtcvad
+from faster_whisper import WhisperModel
 import pyttsx3
-import paho.mqtt.publish as publish
+import paho.mqtt.client as mqtt
 from notecard import notecard
 from pinpong.board import Board, Pin, SR04_URM10, Tone
 import serial
@@ -24,6 +30,17 @@ NOTECARD_BAUD_RATE = 9600
 PRODUCT_UID = "your_product_uid"
 PORT = '/dev/ttyACM0'
 
+# Speech Recognition Configuration
+SAMPLE_RATE = 16000
+FRAME_MS = 30                                      # webrtcvad works on 10/20/30 ms frames
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+SILENCE_END_FRAMES = 800 // FRAME_MS               # ~0.8 s of silence ends an utterance
+SILENCE_END_FRAMES_COMMAND = 400 // FRAME_MS       # shorter hangover once the wake word is heard
+PARTIAL_INTERVAL = 1.0                             # seconds between partial transcriptions
+WHISPER_MODEL_SIZE = "tiny.en"
+WHISPER_COMPUTE_TYPE = "int8"                      # INT8 roughly doubles throughput on the Unihiker's NEON cores
+WHISPER_CPU_THREADS = 4
+
 # Initialize Board and Sensors
 board = Board()
 board.begin()
@@ -38,55 +55,102 @@ engine.setProperty('volume', 1.0)
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
 
+# Persistent MQTT client - connecting once at startup avoids a full
+# TCP + CONNECT handshake on every command.
+def _on_mqtt_connect(client, userdata, flags, rc):
+    # Re-applied on every (re)connect: disable Nagle so small PUBLISH frames
+    # go out immediately instead of waiting on a delayed ACK. The broker side
+    # needs the matching "set_tcp_nodelay true" in mosquitto.conf.
+    try:
+        sock = client.socket()
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except Exception as e:
+        logging.warning(f"Could not set TCP_NODELAY on MQTT socket: {e}")
+
+def _on_mqtt_disconnect(client, userdata, rc):
+    if rc != 0:
+        logging.warning(f"Unexpected MQTT disconnect (rc={rc}), network loop will reconnect.")
+
+_mqtt_client = mqtt.Client()
+_mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+_mqtt_client.on_connect = _on_mqtt_connect
+_mqtt_client.on_disconnect = _on_mqtt_disconnect
+try:
+    _mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+except Exception as e:
+    logging.error(f"Initial MQTT connect failed: {e}")
+_mqtt_client.loop_start()
+
 # Initialize GUI
 u_gui = GUI()
 
-def display_command_on_screen(command):
-    u_gui.clear()
-    x, y = 0, 0
-    max_width = 240  # Screen width limit
-    font_size = 20
-    words = command.split()
+def _layout(words, max_width, font_size):
+    # Pure word-wrap: compute the line breaks before touching the GUI so the
+    # slow draw calls happen in one tight batch afterwards.
+    lines = []
     line = ''
-
     for word in words:
         test_line = f'{line} {word}'.strip()
         text_width = len(test_line) * (font_size // 2)  # Approximate width calculation
         if text_width > max_width:
-            u_gui.draw_text(x=x, y=y, w=max_width, text=line, font_size=font_size, color="#0000FF")
-            y += font_size + 5  # Move to the next line
+            lines.append(line)
             line = word
         else:
             line = test_line
-
     if line:
-        u_gui.draw_text(x=x, y=y, w=max_width, text=line, font_size=font_size, color="#0000FF")
+        lines.append(line)
+    return lines
+
+def _render(lines, max_width, font_size):
+    u_gui.clear()
+    y = 0
+    for line in lines:
+        u_gui.draw_text(x=0, y=y, w=max_width, text=line, font_size=font_size, color="#0000FF")
+        y += font_size + 5  # Move to the next line
+
+def display_command_on_screen(command):
+    max_width = 240  # Screen width limit
+    font_size = 20
+    _render(_layout(command.split(), max_width, font_size), max_width, font_size)
 
 # Helper Functions
+_wifi_state = {"ok": None, "ts": 0.0}
+WIFI_CHECK_TTL = 5.0  # seconds to trust a probe result before re-checking
+
 def check_wifi_connection():
+    # A live broker socket is proof enough that the network is up
+    if _mqtt_client.is_connected():
+        return True
+    # Otherwise probe at most once per TTL so a burst of commands doesn't
+    # pay the (up to 3 s) socket timeout more than once
+    if _wifi_state["ok"] is not None and time.monotonic() - _wifi_state["ts"] < WIFI_CHECK_TTL:
+        return _wifi_state["ok"]
     try:
-        import socket  # Import moved here to resolve the error
         socket.setdefaulttimeout(3)
         socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect(("8.8.8.8", 53))
-        return True
+        ok = True
     except Exception as ex:
         logging.error(f"Wi-Fi check failed: {ex}")
-        return False
+        ok = False
+    _wifi_state["ok"] = ok
+    _wifi_state["ts"] = time.monotonic()
+    return ok
 
 def send_command_via_mqtt(command, retry_attempts=3, retry_delay=2):
     attempts = 0
     while attempts < retry_attempts:
         try:
-            publish.single(MQTT_TOPIC, command, hostname=MQTT_BROKER, port=MQTT_PORT,
-                           auth={'username': MQTT_USERNAME, 'password': MQTT_PASSWORD},
-                           keepalive=60)
-            logging.info("Command sent via MQTT over Wi-Fi.")
-            return
+            result = _mqtt_client.publish(MQTT_TOPIC, command, qos=0)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                logging.info("Command sent via MQTT over Wi-Fi.")
+                return
+            logging.error(f"MQTT publish failed (attempt {attempts + 1}): rc={result.rc}")
         except Exception as e:
             logging.error(f"Failed to send command via MQTT (attempt {attempts + 1}): {e}")
-            attempts += 1
-            time.sleep(retry_delay)
-    
+        attempts += 1
+        time.sleep(retry_delay)
+
     logging.error(f"All {retry_attempts} MQTT send attempts failed.")
 
 def send_command_via_notecard(command):
@@ -97,13 +161,30 @@ def send_command_via_notecard(command):
     except Exception as e:
         logging.error(f"Failed to send command via Notecard: {e}")
 
-def send_command(command):
-    display_command_on_screen(command)
+def _dispatch(command):
     if check_wifi_connection():
         send_command_via_mqtt(command)
     else:
         send_command_via_notecard(command)
 
+def _dispatch_worker():
+    while True:
+        command = _cmd_queue.get()
+        try:
+            _dispatch(command)
+        except Exception as e:
+            logging.error(f"Failed to dispatch command '{command}': {e}")
+
+# Dispatch runs on its own worker thread so the recognition callback only
+# enqueues; the Wi-Fi probe and MQTT/Notecard I/O never block the next
+# utterance.
+_cmd_queue = queue.Queue()
+threading.Thread(target=_dispatch_worker, daemon=True).start()
+
+def send_command(command):
+    display_command_on_screen(command)
+    _cmd_queue.put(command)
+
 def speak(text):
     engine.say(text)
     engine.runAndWait()
@@ -141,81 +222,114 @@ def halloween1_command():
 def halloween2_command():
     send_command("halloween2 activated")
 
-def main():
-    recognizer = sr.Recognizer()
-    microphone = sr.Microphone()
-
-    # Adjust the recognizer sensitivity to ambient noise and record audio
-    with microphone as source:
-        recognizer.dynamic_energy_threshold = False  # Use a fixed energy threshold
-        recognizer.energy_threshold = 300  # Adjust this value as needed
-        recognizer.adjust_for_ambient_noise(source, duration=0.5)
-        print("Set minimum energy threshold to:", recognizer.energy_threshold)
+def transcribe_audio(model, audio_bytes):
+    audio = np.frombuffer(bytes(audio_bytes), dtype=np.int16).astype(np.float32) / 32768.0
+    segments, _ = model.transcribe(audio, language="en", beam_size=1)
+    return " ".join(segment.text.strip() for segment in segments).strip().lower()
 
-    recognizer.pause_threshold = 0.8
-    recognizer.non_speaking_duration = 0.4
+def main():
+    # Load the Whisper model once at startup; recognition runs locally so
+    # commands don't wait on a network round-trip to a cloud ASR service.
+    model = WhisperModel(WHISPER_MODEL_SIZE, device="cpu",
+                         compute_type=WHISPER_COMPUTE_TYPE,
+                         cpu_threads=WHISPER_CPU_THREADS)
+    vad = webrtcvad.Vad(3)
+    frame_queue = queue.Queue()
+
+    def audio_callback(indata, frames, callback_time, status):
+        if status:
+            logging.warning(f"Audio input status: {status}")
+        frame_queue.put(bytes(indata))
 
     listening_for_command = False
     accumulated_command = ''
 
-    def callback(recognizer, audio):
+    def handle_utterance(text):
         nonlocal listening_for_command, accumulated_command
-        try:
-            # Recognize speech
-            text = recognizer.recognize_google(audio).lower()
-            print("You said:", text)
-
-            if 'butler' in text:
-                listening_for_command = True
-                text = text.split('butler', 1)[1].strip()
-                if text:
-                    accumulated_command += ' ' + text
-                print("Wake word detected. Starting to accumulate command.")
-
-            elif listening_for_command:
-                accumulated_command += ' ' + text
+        if not text:
+            print("Could not understand the audio")
+            return
+        print("You said:", text)
 
-            # Process the accumulated command
-            if listening_for_command:
-                print("Accumulated command:", accumulated_command.strip())
-                send_command(accumulated_command.strip())
-                print("Command sent.")
-                listening_for_command = False
-                accumulated_command = ''
+        if 'butler' in text:
+            listening_for_command = True
+            text = text.split('butler', 1)[1].strip()
+            if text:
+                accumulated_command += ' ' + text
+            print("Wake word detected. Starting to accumulate command.")
 
-        except sr.UnknownValueError:
-            print("Could not understand the audio")
-        except sr.RequestError as e:
-            print(f"Could not request results from Speech Recognition service; {e}")
-        except Exception as e:
-            logging.error(f"Unhandled exception in callback: {e}")
+        elif listening_for_command:
+            accumulated_command += ' ' + text
 
-    stop_listening = recognizer.listen_in_background(microphone, callback)
+        # Process the accumulated command
+        if listening_for_command:
+            print("Accumulated command:", accumulated_command.strip())
+            send_command(accumulated_command.strip())
+            print("Command sent.")
+            listening_for_command = False
+            accumulated_command = ''
 
-    button_a_pressed = False
-    button_b_pressed = False
+    def recognition_loop():
+        speech_buffer = bytearray()
+        silence_frames = 0
+        wake_seen = False
+        last_partial = 0.0
 
-    try:
         while True:
-            # Check if button A is pressed and wait for release before triggering again
-            if button_a.is_pressed():
-                if not button_a_pressed:
-                    halloween1_command()
-                    button_a_pressed = True
-            else:
-                button_a_pressed = False
+            try:
+                frame = frame_queue.get()
+
+                if vad.is_speech(frame, SAMPLE_RATE):
+                    speech_buffer += frame
+                    silence_frames = 0
+                    # Run a partial transcription of the in-progress utterance
+                    # so the wake word is spotted while the user is still talking.
+                    if not wake_seen and time.monotonic() - last_partial >= PARTIAL_INTERVAL:
+                        last_partial = time.monotonic()
+                        partial = transcribe_audio(model, speech_buffer)
+                        if 'butler' in partial:
+                            wake_seen = True
+                            print("Wake word heard in partial transcript.")
+                elif speech_buffer:
+                    speech_buffer += frame
+                    silence_frames += 1
+                    # Once a partial transcript has already confirmed the wake
+                    # word, end the utterance on a shorter silence so dispatch
+                    # fires sooner after the user stops talking.
+                    end_frames = SILENCE_END_FRAMES_COMMAND if wake_seen else SILENCE_END_FRAMES
+                    if silence_frames >= end_frames:
+                        handle_utterance(transcribe_audio(model, speech_buffer))
+                        speech_buffer = bytearray()
+                        silence_frames = 0
+                        wake_seen = False
+            except Exception as e:
+                logging.error(f"Unhandled exception in recognition loop: {e}")
+
+    stream = sd.RawInputStream(samplerate=SAMPLE_RATE, blocksize=FRAME_SAMPLES,
+                               dtype='int16', channels=1, callback=audio_callback)
+    stream.start()
+    threading.Thread(target=recognition_loop, daemon=True).start()
+    print("Listening for the wake word...")
+
+    # Edge-triggered button callbacks instead of a 10 Hz polling loop; a
+    # short debounce window filters the extra edges a single press bounces
+    # through.
+    last_press = {'a': 0.0, 'b': 0.0}
+
+    def on_button(name, action):
+        now = time.monotonic()
+        if now - last_press[name] > 0.3:
+            last_press[name] = now
+            action()
+
+    button_a.irq(trigger=Pin.IRQ_FALLING, handler=lambda pin: on_button('a', halloween1_command))
+    button_b.irq(trigger=Pin.IRQ_FALLING, handler=lambda pin: on_button('b', halloween2_command))
 
-            # Check if button B is pressed and wait for release before triggering again
-            if button_b.is_pressed():
-                if not button_b_pressed:
-                    halloween2_command()
-                    button_b_pressed = True
-            else:
-                button_b_pressed = False
-
-            time.sleep(0.1)
+    try:
+        threading.Event().wait()  # Sleep until interrupted; all work happens in callbacks
     except KeyboardInterrupt:
-        stop_listening(wait_for_stop=False)
+        stream.stop()
+        stream.close()
         print("Stopped listening...")
 
 if __name__ == "__main__":
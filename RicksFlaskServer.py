@@ -1,17 +1,27 @@
 import os
+import socket
+import subprocess
 import time
 import threading
 import json
+import queue
 import re
 import pickle
 import logging
+import functools
+from datetime import datetime, timedelta
+import orjson
 from flask import Flask, request, jsonify, abort
+from flask.json.provider import DefaultJSONProvider
 import paho.mqtt.client as mqtt
 import requests  # For Nest API
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from wakeonlan import send_magic_packet  # For Wake-on-LAN
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 import openai
+from apscheduler.schedulers.background import BackgroundScheduler
 
 # ------------------------- Configuration Parameters ------------------------- #
 
@@ -38,6 +48,8 @@ COMPUTER_IP_ADDRESS = os.getenv('COMPUTER_IP_ADDRESS', 'your_computer_ip_address
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'your-openai-api-key')  # Replace with your OpenAI API key
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o')
+OPENAI_REQUEST_TIMEOUT = float(os.getenv('OPENAI_REQUEST_TIMEOUT', 4.0))  # seconds
 
 # Desired Temperatures
 DESIRED_TEMP_COOL = 70  # Default desired temperature for cooling (Fahrenheit)
@@ -48,16 +60,47 @@ TEMP_REVERT_COOL = 75    # Default temperature to revert to after recording (Fah
 # Initialize OpenAI
 openai.api_key = OPENAI_API_KEY
 
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, speeding up every get_json/jsonify call."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Create Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 logging.basicConfig(level=logging.INFO)
 
 # Initialize MQTT client
-mqtt_client = mqtt.Client(client_id="CM4Stack_FireAlarm")
+# The pid suffix keeps the client id unique per process; duplicate ids make
+# the broker evict the existing session, so two workers would perpetually
+# disconnect each other.
+mqtt_client = mqtt.Client(client_id=f"CM4Stack_FireAlarm_{os.getpid()}")
 mqtt_client.username_pw_set(username=MQTT_USERNAME, password=MQTT_PASSWORD)
 
-# Global devices list
+# One long-lived scheduler thread covers all deferred actions instead of a
+# dedicated Timer thread per scheduled call. Jobs live in this process's
+# memory, so replace_existing only dedupes within a single worker — deploy
+# with one gunicorn worker (see wsgi.py) or switch to a shared job store
+# before scaling out.
+_scheduler = BackgroundScheduler()
+_scheduler.start()
+
+# Shared HTTP session for Nest API calls so the TCP/TLS connection is reused
+# across requests instead of paying a fresh handshake per call
+_nest_session = requests.Session()
+_nest_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                            max_retries=Retry(total=2, backoff_factor=0.2)))
+
+# Global devices list and id -> device lookup table. The RLock guards them
+# (and the derived thermostat mappings) now that requests can be handled on
+# multiple threads under gunicorn.
 devices = []
+_devices_by_id = {}
+_state_lock = threading.RLock()
 
 # Thermostat Locations Mapping
 thermostat_locations = {}
@@ -65,8 +108,32 @@ default_thermostat_id = None  # To be set after devices are loaded
 
 # ------------------------------ Helper Functions ------------------------------ #
 
+# In-memory credential cache so every Nest call doesn't re-read and
+# unpickle TOKEN_PICKLE from disk. Guarded by a lock since Flask may
+# dispatch requests concurrently.
+_cached_creds = None
+_creds_lock = threading.Lock()
+
+def _creds_usable(creds):
+    """True if the credentials are valid and not within 60s of expiring."""
+    if not creds or not creds.valid:
+        return False
+    expiry = getattr(creds, 'expiry', None)
+    if expiry is None:
+        return True
+    return (expiry - datetime.utcnow()).total_seconds() > 60
+
 def authenticate_nest():
     """Handles OAuth2 authentication with the Nest API."""
+    global _cached_creds
+    with _creds_lock:
+        if _creds_usable(_cached_creds):
+            return _cached_creds
+        _cached_creds = _load_or_refresh_creds()
+        return _cached_creds
+
+def _load_or_refresh_creds():
+    """Loads credentials from disk, refreshing or re-running the OAuth flow as needed."""
     creds = None
     if os.path.exists(TOKEN_PICKLE):
         with open(TOKEN_PICKLE, 'rb') as token_file:
@@ -108,7 +175,7 @@ def get_nest_devices():
         'Authorization': f'Bearer {access_token}',
         'Content-Type': 'application/json'
     }
-    response = requests.get(url, headers=headers)
+    response = _nest_session.get(url, headers=headers)
     if response.status_code == 200:
         devices_data = response.json().get('devices', [])
         formatted_devices = [{
@@ -148,33 +215,46 @@ def update_smart_devices():
         manual_devices = fetch_manual_devices()
         updated_devices.extend(manual_devices)
 
-        with open(DEVICE_FILE, 'w') as f:
-            json.dump(updated_devices, f, indent=4)
+        with open(DEVICE_FILE, 'wb') as f:
+            f.write(orjson.dumps(updated_devices, option=orjson.OPT_INDENT_2))
 
-        load_devices()  # Reload devices into the global list and mappings
+        load_devices(preloaded=updated_devices)  # Refresh mappings without rereading the file just written
         logging.info("Devices updated successfully.")
         return {"status": "success", "message": "Devices updated successfully"}
     except Exception as e:
         logging.error(f"Failed to update devices: {e}")
         return {"status": "error", "message": f"Failed to update devices: {str(e)}"}
 
-def load_devices():
-    """Loads devices from the DEVICE_FILE and updates mappings."""
-    global devices, thermostat_locations, default_thermostat_id
-    if os.path.exists(DEVICE_FILE):
-        with open(DEVICE_FILE, 'r') as f:
-            devices = json.load(f)
-    else:
-        devices = []
-    
-    # Update thermostat locations and set default
-    thermostat_locations = {}
-    default_thermostat_id = None
-    for device in devices:
-        if device['type'] == 'THERMOSTAT':
-            thermostat_locations[device['name'].lower()] = device['id']
-            if not default_thermostat_id:
-                default_thermostat_id = device['id']  # Set the first thermostat as default
+def load_devices(preloaded=None):
+    """Loads devices from the DEVICE_FILE (or a preloaded list) and updates mappings."""
+    global devices, _devices_by_id, thermostat_locations, default_thermostat_id
+    with _state_lock:
+        if preloaded is not None:
+            devices = preloaded
+        elif os.path.exists(DEVICE_FILE):
+            with open(DEVICE_FILE, 'rb') as f:
+                devices = orjson.loads(f.read())
+        else:
+            devices = []
+
+        # Rebuild the id lookup so execute_action stays O(1) per command
+        _devices_by_id = {device['id']: device for device in devices}
+
+        # Update thermostat locations and set default
+        thermostat_locations = {}
+        default_thermostat_id = None
+        for device in devices:
+            if device['type'] == 'THERMOSTAT':
+                thermostat_locations[device['name'].lower()] = device['id']
+                if not default_thermostat_id:
+                    default_thermostat_id = device['id']  # Set the first thermostat as default
+
+        # Rebuild the AI system prompt here rather than on every AI command,
+        # and drop cached AI responses since they were generated against the
+        # old device list
+        global _system_prompt_cached
+        _system_prompt_cached = _build_system_prompt(devices)
+        _ai_cached.cache_clear()
 
 def set_nest_temperature(device_id, temp_fahrenheit):
     """Sets the Nest thermostat temperature."""
@@ -192,7 +272,7 @@ def set_nest_temperature(device_id, temp_fahrenheit):
             "coolCelsius": temp_celsius
         }
     }
-    response = requests.post(url, json=payload, headers=headers)
+    response = _nest_session.post(url, json=payload, headers=headers)
     if response.status_code != 200:
         logging.error(f"Failed to set Nest temperature: {response.content.decode()}")
         raise Exception(f"Failed to set Nest temperature: {response.content.decode()}")
@@ -207,9 +287,23 @@ def wake_computer():
         send_magic_packet(COMPUTER_MAC_ADDRESS)
 
 def is_computer_on(ip_address):
-    """Checks if the computer is on by pinging its IP address."""
-    response = os.system(f"ping -c 1 {ip_address} > /dev/null 2>&1")
-    return response == 0
+    """Checks if the computer is on via a quick TCP connect, falling back to the ARP table."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(0.3)
+    try:
+        sock.connect((ip_address, 445))  # SMB is listening on a running Windows box
+        return True
+    except OSError:
+        pass
+    finally:
+        sock.close()
+    # No listening port reachable; check the kernel neighbor table instead
+    try:
+        result = subprocess.run(["ip", "neigh", "show", ip_address], capture_output=True, text=True)
+        return "REACHABLE" in result.stdout
+    except Exception as e:
+        logging.warning(f"Neighbor table check failed for {ip_address}: {e}")
+        return False
 
 def schedule_recording(minutes):
     """Schedules actions for recording, including temperature adjustments and waking the computer."""
@@ -219,9 +313,14 @@ def schedule_recording(minutes):
     set_nest_temperature(default_thermostat_id, DESIRED_TEMP_COOL)
     logging.info(f"Temperature set to {DESIRED_TEMP_COOL}°F immediately to cool down the house.")
 
-    # Schedule setting the thermostat to TEMP_REVERT_COOL 1 minute before recording
+    # Schedule setting the thermostat to TEMP_REVERT_COOL 1 minute before recording.
+    # Fixed job ids with replace_existing mean a newer schedule supersedes any
+    # pending one instead of both firing.
     if minutes > 1:
-        threading.Timer((minutes - 1) * 60, set_nest_temperature, args=[default_thermostat_id, TEMP_REVERT_COOL]).start()
+        _scheduler.add_job(set_nest_temperature, 'date',
+                           run_date=datetime.now() + timedelta(minutes=minutes - 1),
+                           args=[default_thermostat_id, TEMP_REVERT_COOL],
+                           id='revert_temp', replace_existing=True)
         logging.info(f"Temperature will be set to {TEMP_REVERT_COOL}°F in {minutes - 1} minutes to turn off AC.")
     else:
         set_nest_temperature(default_thermostat_id, TEMP_REVERT_COOL)
@@ -229,55 +328,78 @@ def schedule_recording(minutes):
 
     # Schedule waking up the computer 2 minutes before recording
     if minutes > 2:
-        threading.Timer((minutes - 2) * 60, wake_computer).start()
+        _scheduler.add_job(wake_computer, 'date',
+                           run_date=datetime.now() + timedelta(minutes=minutes - 2),
+                           id='wake_computer', replace_existing=True)
         logging.info(f"Computer will wake up in {minutes - 2} minutes.")
     else:
         wake_computer()
         logging.info("Recording starts in less than 2 minutes, waking computer immediately.")
 
+# Raw command patterns, merged at import into a single alternation regex so
+# interpret_command classifies a command with one scan instead of one
+# re.search pass per pattern. IGNORECASE replaces the old per-call lower()
+# of the command text.
+_RAW_COMMAND_PATTERNS = [
+    # Wake computer
+    (r'\b(wake|turn on|start|boot up|power up)\s+(the\s+|my\s+)?(computer|pc|laptop)\b', 'wake_computer', {}),
+
+    # Set temperature with location
+    (r'\b(set|adjust|change|make)\s+(the\s+)?(temperature|thermostat)\s+(in\s+(the\s+)?)?(?P<location>\w+)\s*(to\s+)?(?P<temperature>\d+)\b',
+     'set_temperature', {'location': str, 'temperature': int}),
+
+    (r'\b(make)\s+it\s+(?P<temperature>\d+)\s+degrees?\s+in\s+(the\s+)?(?P<location>\w+)\b',
+     'set_temperature', {'temperature': int, 'location': str}),
+
+    # Set temperature without location
+    (r'\b(set|adjust|change|make)\s+(the\s+)?(temperature|thermostat)\s*(to\s+)?(?P<temperature>\d+)\b',
+     'set_temperature', {'temperature': int}),
+    (r'\b(make)\s+it\s+(?P<temperature>\d+)\s+degrees?\b',
+     'set_temperature', {'temperature': int}),
+
+    # Schedule recording
+    (r'\b(start|begin)\s+(a\s+)?recording\s+(in\s+)?(?P<time_phrase>.*)',
+     'schedule_recording', {'time_phrase': str}),
+    (r'\b(record|snooze|stop)\s+(in\s+)?(?P<time_phrase>.*)',
+     'schedule_recording', {'time_phrase': str}),
+
+    # Update smart devices
+    (r'\b(update)\s+(smart\s+)?devices\b',
+     'update_smart_devices', {}),
+]
+
+def _build_command_regex(raw_patterns):
+    """Combines the raw patterns into one alternation with disambiguated group names."""
+    parts = []
+    table = []
+    for index, (pattern, action_name, params_info) in enumerate(raw_patterns):
+        prefix = f'a{index}'
+        # Prefix the named capture groups so the same parameter name can
+        # appear in several alternatives without colliding.
+        renamed = re.sub(r'\(\?P<(\w+)>', lambda m: f'(?P<{prefix}_{m.group(1)}>', pattern)
+        parts.append(f'(?P<{prefix}>{renamed})')
+        table.append((prefix, action_name, params_info))
+    return re.compile('|'.join(parts), re.IGNORECASE), table
+
+_COMMAND_REGEX, _COMMAND_TABLE = _build_command_regex(_RAW_COMMAND_PATTERNS)
+
 def interpret_command(command_text):
     """Interprets the command text and returns an action and parameters."""
-    command_text = command_text.lower().strip()
-
-    command_patterns = [
-        # Wake computer
-        (r'\b(wake|turn on|start|boot up|power up)\s+(the\s+|my\s+)?(computer|pc|laptop)\b', 'wake_computer', {}),
-     
-        # Set temperature with location
-        (r'\b(set|adjust|change|make)\s+(the\s+)?(temperature|thermostat)\s+(in\s+(the\s+)?)?(?P<location>\w+)\s*(to\s+)?(?P<temperature>\d+)\b', 
-         'set_temperature', {'location': str, 'temperature': int}),
-
-        (r'\b(make)\s+it\s+(?P<temperature>\d+)\s+degrees?\s+in\s+(the\s+)?(?P<location>\w+)\b', 
-         'set_temperature', {'temperature': int, 'location': str}),
-
-        # Set temperature without location
-        (r'\b(set|adjust|change|make)\s+(the\s+)?(temperature|thermostat)\s*(to\s+)?(?P<temperature>\d+)\b',
-         'set_temperature', {'temperature': int}),
-        (r'\b(make)\s+it\s+(?P<temperature>\d+)\s+degrees?\b', 
-         'set_temperature', {'temperature': int}),
-
-        # Schedule recording
-        (r'\b(start|begin)\s+(a\s+)?recording\s+(in\s+)?(?P<time_phrase>.*)', 
-         'schedule_recording', {'time_phrase': str}),
-        (r'\b(record|snooze|stop)\s+(in\s+)?(?P<time_phrase>.*)', 
-         'schedule_recording', {'time_phrase': str}),
-
-        # Update smart devices
-        (r'\b(update)\s+(smart\s+)?devices\b', 
-         'update_smart_devices', {}),
-    ]
+    command_text = command_text.strip()
 
-    for pattern, action_name, params_info in command_patterns:
-        match = re.search(pattern, command_text)
-        if match:
+    match = _COMMAND_REGEX.search(command_text)
+    if match:
+        for prefix, action_name, params_info in _COMMAND_TABLE:
+            if match.group(prefix) is None:
+                continue
             parameters = {}
             for param_name, param_type in params_info.items():
-                value = match.group(param_name)
+                value = match.group(f'{prefix}_{param_name}')
                 if value:
                     if param_type == int:
                         parameters[param_name] = int(value)
                     elif param_type == str:
-                        parameters[param_name] = value.strip()
+                        parameters[param_name] = value.strip().lower()
             return action_name, parameters
 
     return None, {}
@@ -301,53 +423,41 @@ def extract_command_text(data):
 
     return None
 
-def format_devices_for_prompt(devices):
-    """Formats device information for the AI prompt."""
-    device_descriptions = []
-    for device in devices:
-        device_descriptions.append(f"{device['name']} (ID: {device['id']}), Type: {device['type']}")
-    return "\n".join(device_descriptions)
+# Outgoing MQTT publish queue. Handlers enqueue; a single worker drains the
+# queue after a short coalescing window so back-to-back messages are written
+# to the broker socket together. With TCP_NODELAY applied in on_connect the
+# kernel then sends them as one segment instead of stalling between frames
+# on a delayed ACK.
+_pub_queue = queue.Queue()
+_PUB_COALESCE_WINDOW = 0.005  # seconds to wait for more messages before flushing
+
+def publish_mqtt(topic, payload):
+    """Queues a message for the batched MQTT publisher."""
+    _pub_queue.put((topic, payload))
+
+def _publish_worker():
+    while True:
+        batch = [_pub_queue.get()]
+        time.sleep(_PUB_COALESCE_WINDOW)
+        while True:
+            try:
+                batch.append(_pub_queue.get_nowait())
+            except queue.Empty:
+                break
+        for topic, payload in batch:
+            try:
+                mqtt_client.publish(topic, payload, qos=0)
+            except Exception as e:
+                logging.error(f"Failed to publish MQTT message on {topic}: {e}")
+        if len(batch) > 1:
+            logging.info(f"Published batch of {len(batch)} MQTT messages.")
 
-def generate_ai_response(prompt):
-    """Generates a response from OpenAI's GPT-4 based on the prompt."""
-    try:
-        device_info = format_devices_for_prompt(devices)
-        system_prompt = (
-            "You are a smart home assistant. "
-            "Your task is to interpret user commands and generate actions to control smart home devices. "
-            "Here is a list of available devices:\n"
-            f"{device_info}\n\n"
-            "When you respond, you must provide a JSON object with the following structure:\n"
-            "{\n"
-            '  "action": "action_name",\n'
-            '  "device_id": "device_id",\n'
-            '  "parameters": { "param1": value1, "param2": value2 }\n'
-            "}\n"
-            "Do not include any extra text or explanations."
-        )
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
-
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=150
-        )
-
-        ai_response = response.choices[0].message.content.strip()
-        logging.info(f"AI Response: {ai_response}")
-        return ai_response
-    except Exception as e:
-        logging.error(f"Error generating AI response: {e}", exc_info=True)
-        return None
+threading.Thread(target=_publish_worker, daemon=True).start()
 
 def execute_action(action, device_id, parameters):
     """Executes the specified action on the given device."""
-    device = next((d for d in devices if d['id'] == device_id), None)
+    with _state_lock:
+        device = _devices_by_id.get(device_id)
 
     if not device:
         logging.warning(f"Device with ID '{device_id}' not found. Treating as custom device.")
@@ -356,7 +466,7 @@ def execute_action(action, device_id, parameters):
 
     if device["controller"] == "mqtt":
         if action == "activate":
-            mqtt_client.publish(f"home/{device['id']}", "activate")
+            publish_mqtt(f"home/{device['id']}", "activate")
             logging.info(f"Activated device {device['name']} via MQTT.")
         else:
             logging.error(f"Unknown action '{action}' for MQTT controller.")
@@ -376,7 +486,7 @@ def execute_action(action, device_id, parameters):
 
 def dispatch_unrecognized_command(command_text):
     """Forwards unrecognized commands to devices via MQTT."""
-    mqtt_client.publish(DEVICE_COMMAND_TOPIC, command_text)
+    publish_mqtt(DEVICE_COMMAND_TOPIC, command_text)
     logging.info(f"Forwarded unrecognized command to devices: {command_text}")
 
 # ------------------------------ Flask Routes ------------------------------ #
@@ -422,6 +532,11 @@ def handle_command():
             ai_prompt = command_text[3:].strip()
             ai_response = generate_ai_response(ai_prompt)
             if not ai_response:
+                # AI unavailable or timed out; fall back to the regex interpreter
+                action, parameters = interpret_command(ai_prompt)
+                if action:
+                    execute_action(action, parameters.get('device_id'), parameters)
+                    return jsonify({"message": f"Action '{action}' executed."}), 200
                 return jsonify({"status": "error", "message": "Failed to generate AI response."}), 500
 
             try:
@@ -464,45 +579,79 @@ def format_devices_for_prompt(devices):
         device_descriptions.append(f"{device['name']} (ID: {device['id']}), Type: {device['type']}")
     return "\n".join(device_descriptions)
 
+def _build_system_prompt(devices):
+    """Builds the system prompt for the AI from the current device list."""
+    device_info = format_devices_for_prompt(devices)
+    return (
+        "You are a smart home assistant. "
+        "Your task is to interpret user commands and generate actions to control smart home devices. "
+        "Here is a list of available devices:\n"
+        f"{device_info}\n\n"
+        "When you respond, you must provide a JSON object with the following structure:\n"
+        "{\n"
+        '  "action": "action_name",\n'
+        '  "device_id": "device_id",\n'
+        '  "parameters": { "param1": value1, "param2": value2 }\n'
+        "}\n"
+        "Do not include any extra text or explanations."
+    )
+
+# Rebuilt by load_devices whenever the device list changes, so AI requests
+# don't reassemble the whole prompt string per call
+_system_prompt_cached = _build_system_prompt([])
+
+def _ai_impl(prompt_key):
+    """Calls OpenAI for the normalized prompt; raises on failure or timeout."""
+    messages = [
+        {"role": "system", "content": _system_prompt_cached},
+        {"role": "user", "content": prompt_key}
+    ]
+
+    response = openai.ChatCompletion.create(
+        model=OPENAI_MODEL,
+        messages=messages,
+        temperature=0.7,
+        max_tokens=150,
+        request_timeout=OPENAI_REQUEST_TIMEOUT
+    )
+
+    ai_response = response.choices[0].message.content.strip()
+    logging.info(f"AI Response: {ai_response}")
+    return ai_response
+
+# Many phrasings normalize to the same prompt; warm repeats skip the network
+# call entirely. Failed calls raise, so lru_cache never pins an error result.
+# load_devices clears the cache when the device list (and thus the system
+# prompt) changes.
+_ai_cached = functools.lru_cache(maxsize=256)(_ai_impl)
+
 def generate_ai_response(prompt):
-    """Generates a response from OpenAI's GPT-4o based on the prompt."""
+    """Generates (or replays a cached) AI response for the prompt."""
+    prompt_key = " ".join(prompt.lower().split())
     try:
-        device_info = format_devices_for_prompt(devices)
-        system_prompt = (
-            "You are a smart home assistant. "
-            "Your task is to interpret user commands and generate actions to control smart home devices. "
-            "Here is a list of available devices:\n"
-            f"{device_info}\n\n"
-            "When you respond, you must provide a JSON object with the following structure:\n"
-            "{\n"
-            '  "action": "action_name",\n'
-            '  "device_id": "device_id",\n'
-            '  "parameters": { "param1": value1, "param2": value2 }\n'
-            "}\n"
-            "Do not include any extra text or explanations."
-        )
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
-
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=150
-        )
-
-        ai_response = response.choices[0].message.content.strip()
-        logging.info(f"AI Response: {ai_response}")
-        return ai_response
+        return _ai_cached(prompt_key)
     except Exception as e:
         logging.error(f"Error generating AI response: {e}", exc_info=True)
         return None
 
 # ----------------------------- Main Execution ----------------------------- #
 
+def on_connect(client, userdata, flags, rc):
+    """Logs the connection result and re-applies TCP_NODELAY on every (re)connect."""
+    logging.info(f"Connected to MQTT broker with result code {rc}.")
+    # Disable Nagle so back-to-back small PUBLISH frames aren't stalled behind
+    # a delayed ACK. The broker should set "set_tcp_nodelay true" as well.
+    try:
+        sock = client.socket()
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except Exception as e:
+        logging.warning(f"Could not set TCP_NODELAY on MQTT socket: {e}")
+
+def on_message(client, userdata, msg):
+    """Logs messages received on subscribed topics."""
+    logging.info(f"MQTT message on {msg.topic}: {msg.payload.decode(errors='replace')}")
+
 def setup_mqtt():
     """Sets up the MQTT client and starts the loop."""
     mqtt_client.on_connect = on_connect
@@ -514,10 +663,22 @@ def setup_mqtt():
     except Exception as e:
         logging.error(f"Failed to connect to MQTT Broker: {e}")
 
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_app():
+    """Loads devices and starts the MQTT loop; safe to call once per worker process."""
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        load_devices()
+        setup_mqtt()
+        _initialized = True
+
 def main():
     """Main function to run the Flask server and initialize components."""
-    load_devices()
-    setup_mqtt()
+    init_app()
     try:
         app.run(host='0.0.0.0', port=HTTP_SERVER_PORT)
     except Exception as e:
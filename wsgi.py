@@ -0,0 +1,13 @@
+"""WSGI entry point for running the server under a production server, e.g.:
+
+    gunicorn -k gthread -w 1 --threads 8 -b 0.0.0.0:5000 wsgi:app
+
+Run a single worker process: the device list, publish queue, and recording
+scheduler all live in process memory, so threads provide the concurrency and
+the RLock provides the safety. The MQTT client id is suffixed with the pid
+so even a multi-worker launch won't make the broker evict sessions.
+"""
+
+from RicksFlaskServer import app, init_app
+
+init_app()